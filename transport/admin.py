@@ -3,12 +3,59 @@ from .models import User, Route, Stop, Bus, Ticket, BusLiveLocation, DriverRegis
 
 admin.site.register(User)
 admin.site.register(Route)
-admin.site.register(Stop)
-admin.site.register(Bus)
-admin.site.register(Ticket)
-admin.site.register(BusLiveLocation)
-admin.site.register(DriverRegistration)
-admin.site.register(DriverBusAssignment)
+
+
+@admin.register(Stop)
+class StopAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'route', 'order', 'latitude', 'longitude')
+    list_select_related = ('route',)
+    list_filter = ('route',)
+    search_fields = ('name', 'route__name')
+    ordering = ('route', 'order', 'id')
+
+
+@admin.register(Bus)
+class BusAdmin(admin.ModelAdmin):
+    list_display = ('id', 'vehicle_number', 'operator_name', 'route', 'otp_code', 'status', 'trip_active')
+    list_select_related = ('route',)
+    list_filter = ('status', 'trip_active', 'operator_type')
+    search_fields = ('vehicle_number', 'operator_name', 'otp_code')
+    # Both are maintained by the app (Bus.save / start_trip / end_trip), not by hand.
+    readonly_fields = ('active_trip', 'route_name')
+
+
+@admin.register(Ticket)
+class TicketAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'bus', 'source_stop', 'destination_stop', 'fare', 'created_at')
+    list_select_related = ('user', 'bus')
+    list_filter = ('created_at',)
+    search_fields = ('user__username', 'bus__vehicle_number')
+    raw_id_fields = ('user', 'bus')
+
+
+@admin.register(BusLiveLocation)
+class BusLiveLocationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'bus', 'latitude', 'longitude', 'speed', 'updated_at')
+    list_select_related = ('bus',)
+    search_fields = ('bus__vehicle_number',)
+    raw_id_fields = ('bus',)
+
+
+@admin.register(DriverRegistration)
+class DriverRegistrationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'bus_otp', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'bus_otp')
+    raw_id_fields = ('user',)
+
+
+@admin.register(DriverBusAssignment)
+class DriverBusAssignmentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'bus', 'active', 'start_time', 'end_time')
+    list_select_related = ('user', 'bus')
+    list_filter = ('active',)
+    search_fields = ('user__username', 'bus__vehicle_number')
+    raw_id_fields = ('user', 'bus')
 
 
 # Register your models here.
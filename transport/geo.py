@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import itertools
+from math import asin, cos, hypot, sin, sqrt
+
+
+EARTH_RADIUS_M = 6371000
+
+_DEG2RAD = 0.017453292519943295  # math.pi / 180
+_R2 = 2.0 * EARTH_RADIUS_M
+
+
+def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Float-only kernel; callers are responsible for coercing inputs.
+    sdp = sin((lat2 - lat1) * (_DEG2RAD * 0.5))
+    sdl = sin((lon2 - lon1) * (_DEG2RAD * 0.5))
+    a = sdp * sdp + cos(lat1 * _DEG2RAD) * cos(lat2 * _DEG2RAD) * sdl * sdl
+    # 2*asin(sqrt(a)) == 2*atan2(sqrt(a), sqrt(1-a)); clamp for rounding near antipodes.
+    return _R2 * asin(min(1.0, sqrt(a)))
+
+
+def distance_meters(lat1, lon1, lat2, lon2):
+    return _haversine_m(float(lat1), float(lon1), float(lat2), float(lon2))
+
+
+def haversine_rad_m(phi1: float, lam1: float, cos_phi1: float, phi2: float, lam2: float, cos_phi2: float) -> float:
+    """Haversine on coordinates already in radians, with both latitude cosines supplied.
+
+    Lets callers reuse cached per-stop trig (see RouteView) so only two sin() calls remain.
+    """
+    sdp = sin((phi2 - phi1) * 0.5)
+    sdl = sin((lam2 - lam1) * 0.5)
+    a = sdp * sdp + cos_phi1 * cos_phi2 * sdl * sdl
+    return _R2 * asin(min(1.0, sqrt(a)))
+
+
+def radian_columns(lats, lons):
+    """Returns (lat_rad, lon_rad, cos_lat) tuples for per-route caching."""
+    lat_rad = tuple(lat * _DEG2RAD for lat in lats)
+    lon_rad = tuple(lon * _DEG2RAD for lon in lons)
+    return lat_rad, lon_rad, tuple(map(cos, lat_rad))
+
+
+def equirect_distances_from(lat, lng, lat_rad, lon_rad) -> list[float]:
+    """Equirectangular distances from one point (degrees) to stops given in radians.
+
+    Within 0.1% of haversine over a few kilometres and trig-free per pair, so it is
+    meant for short-range checks such as snapping a bus to a nearby stop.
+    """
+    phi = float(lat) * _DEG2RAD
+    lam = float(lng) * _DEG2RAD
+    kx = EARTH_RADIUS_M * cos(phi)
+    return [
+        hypot((lam2 - lam) * kx, (phi2 - phi) * EARTH_RADIUS_M)
+        for phi2, lam2 in zip(lat_rad, lon_rad)
+    ]
+
+
+def segment_distances_m(lats, lons) -> list[float]:
+    """Distances between consecutive points, i.e. `len(lats) - 1` route segments."""
+    return list(map(_haversine_m, lats, lons, lats[1:], lons[1:]))
+
+
+def cumulative_distances_m(lats, lons) -> list[float]:
+    """Prefix sums of stop-to-stop distances along a route.
+
+    `cum[i]` is the path length from the first stop to stop `i`, so the path
+    between stops `i` and `j` is `cum[j] - cum[i]`.
+    """
+    if not lats:
+        return []
+    return list(itertools.accumulate(segment_distances_m(lats, lons), initial=0.0))
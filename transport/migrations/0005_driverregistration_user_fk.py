@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.db import migrations, models
+from django.db import migrations, models, transaction
 import django.db.models.deletion
 
 
@@ -7,21 +7,33 @@ def forwards(apps, schema_editor):
     DriverRegistration = apps.get_model("transport", "DriverRegistration")
     User = apps.get_model("transport", "User")
 
-    for reg in DriverRegistration.objects.all():
-        # Only old rows (from migration 0004) have driver_name/role fields
-        driver_name = getattr(reg, "driver_name", None)
-        if not driver_name:
-            continue
+    # Only old rows (from migration 0004) have driver_name/role fields
+    regs = [
+        reg for reg in DriverRegistration.objects.only("id", "driver_name")
+        if getattr(reg, "driver_name", None)
+    ]
+    if not regs:
+        return
+
+    with transaction.atomic():
+        names = {reg.driver_name for reg in regs}
+        existing = set(User.objects.filter(username__in=names).values_list("username", flat=True))
 
-        user = User.objects.filter(username=driver_name).first()
-        if not user:
+        missing = names - existing
+        if missing:
             # Historical model instances in migrations don't have helpers like
             # set_unusable_password()/set_password(). Use an unusable password
             # marker directly (Django treats passwords starting with '!' as unusable).
-            user = User.objects.create(username=driver_name, role="driver", password="!")
+            User.objects.bulk_create(
+                [User(username=name, role="driver", password="!") for name in missing],
+                batch_size=500,
+                ignore_conflicts=True,
+            )
 
-        reg.user = user
-        reg.save(update_fields=["user"])
+        users = User.objects.in_bulk(names, field_name="username")
+        for reg in regs:
+            reg.user_id = users[reg.driver_name].id
+        DriverRegistration.objects.bulk_update(regs, ["user"], batch_size=1000)
 
 
 class Migration(migrations.Migration):
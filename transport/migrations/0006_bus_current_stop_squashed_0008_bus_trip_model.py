@@ -0,0 +1,42 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ("transport", "0006_bus_current_stop"),
+        ("transport", "0007_bus_trip_fields"),
+        ("transport", "0008_bus_trip_model"),
+    ]
+
+    dependencies = [
+        ("transport", "0005_driverregistration_user_fk"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bus",
+            name="current_stop",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name="bus",
+            name="trip_active",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="bus",
+            name="trip_start_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="BusTrip",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("start_time", models.DateTimeField()),
+                ("end_time", models.DateTimeField(blank=True, null=True)),
+                ("bus", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="transport.bus")),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-15 09:41
+
+import transport.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transport', '0009_driverbusassignment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bus',
+            name='otp_code',
+            field=models.CharField(db_index=True, default=transport.models.generate_otp, max_length=5),
+        ),
+        migrations.AddIndex(
+            model_name='buslivelocation',
+            index=models.Index(fields=['bus', '-updated_at'], name='buslocation_bus_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bustrip',
+            index=models.Index(fields=['bus', '-start_time'], name='bustrip_bus_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='driverbusassignment',
+            index=models.Index(fields=['user', 'bus', 'active'], name='assignment_user_bus_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['user', '-created_at'], name='ticket_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-15 09:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transport', '0010_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='buslivelocation',
+            options={'ordering': ['-updated_at', '-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='bustrip',
+            options={'ordering': ['-start_time', '-id']},
+        ),
+        migrations.AlterField(
+            model_name='bustrip',
+            name='bus',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trips', to='transport.bus'),
+        ),
+        migrations.AddIndex(
+            model_name='bustrip',
+            index=models.Index(fields=['bus', 'end_time'], name='bustrip_bus_end_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+import transport.models
+
+
+def dedupe_otp_codes(apps, schema_editor):
+    Bus = apps.get_model("transport", "Bus")
+
+    duplicated = (
+        Bus.objects.values("otp_code")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("otp_code", flat=True)
+    )
+    duplicated = list(duplicated)
+    if not duplicated:
+        return
+
+    taken = set(Bus.objects.values_list("otp_code", flat=True))
+    changed = []
+    for otp in duplicated:
+        # Keep the oldest bus on its OTP; give the others fresh codes.
+        for bus in Bus.objects.filter(otp_code=otp).order_by("id")[1:]:
+            new_otp = transport.models.generate_otp()
+            while new_otp in taken:
+                new_otp = transport.models.generate_otp()
+            taken.add(new_otp)
+            bus.otp_code = new_otp
+            changed.append(bus)
+    Bus.objects.bulk_update(changed, ["otp_code"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transport", "0011_bustrip_related_name_and_ordering"),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_otp_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="bus",
+            name="otp_code",
+            field=models.CharField(default=transport.models.generate_otp, max_length=5, unique=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_route_name(apps, schema_editor):
+    Bus = apps.get_model("transport", "Bus")
+    Route = apps.get_model("transport", "Route")
+
+    Bus.objects.update(
+        route_name=Subquery(Route.objects.filter(pk=OuterRef("route_id")).values("name")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transport", "0012_bus_otp_code_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bus",
+            name="route_name",
+            field=models.CharField(blank=True, db_index=True, default="", max_length=100),
+        ),
+        migrations.RunPython(populate_route_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.2 on 2026-10-15 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transport', '0013_bus_route_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bus',
+            name='operator_name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='driverbusassignment',
+            index=models.Index(fields=['user', 'active', 'end_time'], name='assignment_user_active_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_active_trip(apps, schema_editor):
+    Bus = apps.get_model("transport", "Bus")
+    BusTrip = apps.get_model("transport", "BusTrip")
+
+    open_trips = BusTrip.objects.filter(bus_id=OuterRef("pk"), end_time__isnull=True).order_by("-start_time", "-id")
+    Bus.objects.update(active_trip=Subquery(open_trips.values("pk")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transport", "0014_driver_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bus",
+            name="active_trip",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="transport.bustrip",
+            ),
+        ),
+        migrations.RunPython(populate_active_trip, migrations.RunPython.noop),
+    ]
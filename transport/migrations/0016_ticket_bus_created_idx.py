@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-15 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transport', '0015_bus_active_trip'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['bus', '-created_at'], name='ticket_bus_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_trips(apps, schema_editor):
+    """Creates the missing BusTrip for buses whose trip was started by the old flag-only code."""
+    Bus = apps.get_model("transport", "Bus")
+    BusTrip = apps.get_model("transport", "BusTrip")
+
+    now = timezone.now()
+    for bus in Bus.objects.filter(trip_active=True, active_trip__isnull=True).only("id", "trip_start_time"):
+        start_time = bus.trip_start_time or now
+        trip = BusTrip.objects.create(bus_id=bus.id, start_time=start_time)
+        Bus.objects.filter(pk=bus.id).update(trip_start_time=start_time, active_trip=trip)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transport", "0016_ticket_bus_created_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_trips, migrations.RunPython.noop),
+    ]
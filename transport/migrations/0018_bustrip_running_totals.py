@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_trip_totals(apps, schema_editor):
+    BusTrip = apps.get_model("transport", "BusTrip")
+    Ticket = apps.get_model("transport", "Ticket")
+
+    for trip in BusTrip.objects.only("id", "bus_id", "start_time", "end_time").iterator():
+        window = Q(bus_id=trip.bus_id, created_at__gte=trip.start_time)
+        if trip.end_time is not None:
+            window &= Q(created_at__lte=trip.end_time)
+        agg = Ticket.objects.filter(window).aggregate(total=Sum("fare"), n=Count("id"))
+        if agg["n"]:
+            BusTrip.objects.filter(pk=trip.pk).update(total_fare=agg["total"], ticket_count=agg["n"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transport", "0017_backfill_flag_only_trips"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bustrip",
+            name="ticket_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="bustrip",
+            name="total_fare",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(populate_trip_totals, migrations.RunPython.noop),
+    ]
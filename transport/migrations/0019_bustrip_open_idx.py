@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-15 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transport', '0018_bustrip_running_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bustrip',
+            name='bustrip_bus_end_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bustrip',
+            index=models.Index(condition=models.Q(('end_time__isnull', True)), fields=['bus'], name='bustrip_open_idx'),
+        ),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
-import random
+import secrets
 import string
+import time
 
 # ---------- USER ----------
 class User(AbstractUser):
@@ -23,6 +24,16 @@ class Route(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # No bus can reference a route that is only now being inserted.
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        super().save(*args, **kwargs)
+        if adding or (update_fields is not None and 'name' not in update_fields):
+            return
+        # Keep the denormalized Bus.route_name in sync.
+        Bus.objects.filter(route_id=self.pk).exclude(route_name=self.name).update(route_name=self.name)
+
 
 # ---------- STOP ----------
 class Stop(models.Model):
@@ -37,24 +48,75 @@ class Stop(models.Model):
 
 
 # ---------- BUS ----------
+OTP_ALPHABET = string.ascii_uppercase + string.digits
+OTP_LENGTH = 5
+
+
 def generate_otp():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
+    # The OTP doubles as the passenger/driver access code for a bus, so draw it
+    # from the OS CSPRNG rather than the predictable `random` module.
+    return ''.join(secrets.choice(OTP_ALPHABET) for _ in range(OTP_LENGTH))
 
 class Bus(models.Model):
     vehicle_number = models.CharField(max_length=20)
     operator_type = models.CharField(max_length=20)
-    operator_name = models.CharField(max_length=100)
+    # Indexed for the legacy operator_name -> driver username fallback in driver views.
+    operator_name = models.CharField(max_length=100, db_index=True)
     route = models.ForeignKey(Route, on_delete=models.CASCADE)
+    # Denormalized copy of route.name so stop/fare lookups by OTP don't need a join.
+    route_name = models.CharField(max_length=100, blank=True, default='', db_index=True)
     base_fare = models.DecimalField(max_digits=6, decimal_places=2)
-    otp_code = models.CharField(max_length=5, default=generate_otp)
+    otp_code = models.CharField(max_length=OTP_LENGTH, default=generate_otp, unique=True)
     status = models.CharField(max_length=20, default="active")
     current_stop = models.CharField(max_length=100, null=True, blank=True)
     trip_active = models.BooleanField(default=False)
     trip_start_time = models.DateTimeField(null=True, blank=True)
+    # The open BusTrip, kept in step by start_trip/end_trip so driver views fetch it by pk.
+    active_trip = models.ForeignKey('BusTrip', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
 
     def __str__(self):
         return self.vehicle_number
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self.route_id and (update_fields is None or not {'route', 'route_id'}.isdisjoint(update_fields)):
+            self.route_name = self.route.name
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'route_name'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def by_otp(cls, otp):
+        """Returns a cached (bus_id, route_id) pair for `otp`, or None.
+
+        Misses are not cached, so a newly registered bus is visible immediately.
+        Hits expire after OTP_CACHE_TTL seconds so OTP rotations, route changes and
+        deletions made by another worker process are picked up.
+        """
+        entry = _otp_cache.get(otp)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        row = cls.objects.filter(otp_code=otp).values_list('id', 'route_id').first()
+        if row is None:
+            _otp_cache.pop(otp, None)
+            return None
+        if len(_otp_cache) >= OTP_CACHE_MAXSIZE:
+            _otp_cache.clear()
+        _otp_cache[otp] = (now + OTP_CACHE_TTL, row)
+        return row
+
+    @classmethod
+    def clear_otp_cache(cls):
+        _otp_cache.clear()
+
+
+OTP_CACHE_TTL = 30.0
+OTP_CACHE_MAXSIZE = 1024
+
+# otp -> (expires_at, (bus_id, route_id))
+_otp_cache: dict[str, tuple] = {}
+
 
 # ---------- TICKET ----------
 class Ticket(models.Model):
@@ -66,6 +128,12 @@ class Ticket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='ticket_user_created_idx'),
+            models.Index(fields=['bus', '-created_at'], name='ticket_bus_created_idx'),
+        ]
+
 
 # ---------- LIVE TRACKING ----------
 class BusLiveLocation(models.Model):
@@ -75,6 +143,12 @@ class BusLiveLocation(models.Model):
     speed = models.FloatField()
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        ordering = ['-updated_at', '-id']
+        indexes = [
+            models.Index(fields=['bus', '-updated_at'], name='buslocation_bus_updated_idx'),
+        ]
+
 
 # ---------- DRIVER REGISTRATION (simple mapping) ----------
 class DriverRegistration(models.Model):
@@ -94,6 +168,12 @@ class DriverBusAssignment(models.Model):
     start_time = models.DateTimeField(default=timezone.now)
     end_time = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'bus', 'active'], name='assignment_user_bus_idx'),
+            models.Index(fields=['user', 'active', 'end_time'], name='assignment_user_active_idx'),
+        ]
+
     def __str__(self):
         status = 'active' if self.active and self.end_time is None else 'inactive'
         return f"{self.user.username} -> {self.bus.vehicle_number} ({status})"
@@ -101,9 +181,20 @@ class DriverBusAssignment(models.Model):
 
 # ---------- BUS TRIPS (history) ----------
 class BusTrip(models.Model):
-    bus = models.ForeignKey(Bus, on_delete=models.CASCADE)
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='trips')
     start_time = models.DateTimeField()
     end_time = models.DateTimeField(null=True, blank=True)
+    # Running totals of the tickets inside the trip window, maintained by signals.py.
+    total_fare = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    ticket_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-start_time', '-id']
+        indexes = [
+            models.Index(fields=['bus', '-start_time'], name='bustrip_bus_start_idx'),
+            # At most one open trip per bus, so this stays tiny however long the history grows.
+            models.Index(fields=['bus'], condition=models.Q(end_time__isnull=True), name='bustrip_open_idx'),
+        ]
 
     def __str__(self):
         return f"{self.bus.vehicle_number} {self.start_time}"
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import orjson
+from django.http import HttpResponse, JsonResponse
+
+
+class OrjsonResponse(HttpResponse):
+    """JSON response encoded with orjson, for the larger list payloads.
+
+    datetimes are serialised natively in the same RFC 3339 form as `isoformat()`, so
+    callers can pass them through unformatted.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(orjson.dumps(data), **kwargs)
+
+
+class CompactJsonResponse(JsonResponse):
+    """JsonResponse without the spaces json.dumps puts after ',' and ':'.
+
+    Keeps DjangoJSONEncoder (and its datetime format), unlike OrjsonResponse.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('json_dumps_params', {'separators': (',', ':')})
+        super().__init__(data, **kwargs)
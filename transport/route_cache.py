@@ -0,0 +1,90 @@
+"""Per-process cache of each route's stops.
+
+Stop edits made in this process invalidate the route immediately (see signals.py).
+Entries also expire after ROUTE_CACHE_TTL seconds so edits made by another worker
+process are picked up.
+"""
+from __future__ import annotations
+
+import time
+from collections import namedtuple
+
+from .geo import cumulative_distances_m, radian_columns
+from .models import Stop
+
+
+ROUTE_CACHE_TTL = 60.0
+
+StopRecord = namedtuple('StopRecord', 'id name order latitude longitude')
+
+# Column-wise view of a route for the distance helpers: parallel tuples in travel order,
+# `cum[i]` the path length from the first stop to stop `i`, `pos` mapping stop id -> index.
+# lat_rad/lon_rad/cos_lat are precomputed so per-ping distance kernels skip per-stop trig.
+RouteView = namedtuple('RouteView', 'ids names orders lats lons cum pos lat_rad lon_rad cos_lat')
+
+# route_id -> (expires_at, stops, view, (by_id, by_name))
+_cache: dict[int, tuple] = {}
+# route_id -> invalidation counter; guards against caching a load that raced an edit.
+_versions: dict[int, int] = {}
+
+
+def _load(route_id):
+    version = _versions.get(route_id, 0)
+    rows = (
+        Stop.objects.filter(route_id=route_id)
+        .order_by('order', 'id')
+        .values_list('id', 'name', 'order', 'latitude', 'longitude')
+    )
+    stops = tuple(StopRecord._make(row) for row in rows)
+    if stops:
+        ids, names, orders, lats, lons = zip(*stops)
+    else:
+        ids = names = orders = lats = lons = ()
+    view = RouteView(
+        ids, names, orders, lats, lons,
+        cumulative_distances_m(lats, lons),
+        {stop_id: i for i, stop_id in enumerate(ids)},
+        *radian_columns(lats, lons),
+    )
+    by_id = {s.id: s for s in stops}
+    by_name = {}
+    for s in stops:
+        # First stop in travel order wins for duplicate names.
+        by_name.setdefault(s.name, s)
+    entry = (stops, view, (by_id, by_name))
+    if _versions.get(route_id, 0) == version:
+        _cache[route_id] = (time.monotonic() + ROUTE_CACHE_TTL, *entry)
+    return entry
+
+
+def _entry(route_id):
+    entry = _cache.get(route_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1:]
+    return _load(route_id)
+
+
+def get_route_stops_cached(route_id) -> tuple[StopRecord, ...]:
+    """Returns the route's stops in travel order as lightweight records."""
+    return _entry(route_id)[0]
+
+
+def route_view(route_id) -> RouteView:
+    """Returns the route's stops as parallel columns plus cumulative path distances."""
+    return _entry(route_id)[1]
+
+
+def route_stop_lookup(route_id):
+    """Returns ({id: StopRecord}, {name: StopRecord}) for the route."""
+    return _entry(route_id)[2]
+
+
+def invalidate_route(route_id):
+    _versions[route_id] = _versions.get(route_id, 0) + 1
+    _cache.pop(route_id, None)
+
+
+def clear():
+    """Drops every cached route, e.g. between tests where rolled-back ids get reused."""
+    _versions.clear()
+    _cache.clear()
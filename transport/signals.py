@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Bus, BusTrip, Stop, Ticket
+from .route_cache import invalidate_route
+
+
+# Bus.by_otp caches only (id, route_id) per otp_code. Views that change other Bus columns
+# (current_stop, trip state) use queryset.update(), which skips this signal, and that is
+# safe; anything that changes otp_code or route must go through save() or delete().
+@receiver([post_save, post_delete], sender=Bus)
+def clear_bus_otp_cache(sender, **kwargs):
+    Bus.clear_otp_cache()
+
+
+@receiver(pre_save, sender=Stop)
+def remember_stop_route(sender, instance, **kwargs):
+    # A stop moved to another route must also drop out of its old route's cache entry.
+    if not instance._state.adding:
+        instance._previous_route_id = (
+            Stop.objects.filter(pk=instance.pk).values_list('route_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Stop)
+def clear_route_stop_cache(sender, instance, **kwargs):
+    invalidate_route(instance.route_id)
+    previous_route_id = getattr(instance, '_previous_route_id', None)
+    if previous_route_id is not None and previous_route_id != instance.route_id:
+        invalidate_route(previous_route_id)
+
+
+def _adjust_trip_totals(ticket, sign):
+    # Same window the trip views use: start_time <= created_at <= end_time (open-ended if running).
+    fare = Decimal(str(ticket.fare))
+    BusTrip.objects.filter(
+        Q(end_time__isnull=True) | Q(end_time__gte=ticket.created_at),
+        bus_id=ticket.bus_id,
+        start_time__lte=ticket.created_at,
+    ).update(total_fare=F('total_fare') + sign * fare, ticket_count=F('ticket_count') + sign)
+
+
+@receiver(post_save, sender=Ticket)
+def add_ticket_to_trip_totals(sender, instance, created, raw=False, **kwargs):
+    # Fixture loads (raw) carry totals already; counting them again would double up.
+    if created and not raw:
+        _adjust_trip_totals(instance, 1)
+
+
+@receiver(post_delete, sender=Ticket)
+def remove_ticket_from_trip_totals(sender, instance, **kwargs):
+    _adjust_trip_totals(instance, -1)
@@ -2,9 +2,11 @@ from __future__ import annotations
 
 from datetime import timedelta
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 
+from . import route_cache
 from .models import Bus, BusLiveLocation, BusTrip, DriverBusAssignment, Route, Stop, Ticket, User
 
 
@@ -13,27 +15,33 @@ def _mk_route_with_stops(*, name: str = 'R1'):
 	# Roughly 1 km per 0.009 degrees latitude.
 	# Stop0 -> Stop3 is set to ~2.4km (should fare = 10).
 	# Stop0 -> Stop4 is set to ~3.4km (should fare = 11).
-	stops = [
-		Stop.objects.create(route=route, name='S0', order=0, latitude=0.0000, longitude=0.0),
-		Stop.objects.create(route=route, name='S1', order=1, latitude=0.0090, longitude=0.0),
-		Stop.objects.create(route=route, name='S2', order=2, latitude=0.0180, longitude=0.0),
-		Stop.objects.create(route=route, name='S3', order=3, latitude=0.0216, longitude=0.0),
-		Stop.objects.create(route=route, name='S4', order=4, latitude=0.0306, longitude=0.0),
-	]
+	Stop.objects.bulk_create([
+		Stop(route=route, name=f'S{i}', order=i, latitude=lat, longitude=0.0)
+		for i, lat in enumerate([0.0000, 0.0090, 0.0180, 0.0216, 0.0306])
+	])
+	stops = list(Stop.objects.filter(route=route).order_by('order'))
 	return route, stops
 
 
 class KbusSmokeTests(TestCase):
-	def setUp(self):
-		self.route, self.stops = _mk_route_with_stops()
-		self.bus = Bus.objects.create(
+	@classmethod
+	def setUpTestData(cls):
+		cls.route, cls.stops = _mk_route_with_stops()
+		cls.bus = Bus.objects.create(
 			vehicle_number='KL07AB1234',
 			operator_type='private',
 			operator_name='operator',
-			route=self.route,
+			route=cls.route,
 			base_fare='10.00',
 		)
 
+	def setUp(self):
+		# Both caches are process-wide and ids are reused after each test's rollback.
+		route_cache.clear()
+		Bus.clear_otp_cache()
+		self.addCleanup(route_cache.clear)
+		self.addCleanup(Bus.clear_otp_cache)
+
 	def test_calculate_fare_rejects_same_stop(self):
 		res = self.client.post(
 			'/transport/calculate-fare/',
@@ -63,28 +71,72 @@ class KbusSmokeTests(TestCase):
 		self.assertEqual(res_35.status_code, 200)
 		self.assertEqual(res_35.json().get('fare'), 11.0)
 
+	def test_otp_cache_drops_rotated_code(self):
+		old_otp = self.bus.otp_code
+		fare_data = {'source': str(self.stops[0].id), 'destination': str(self.stops[3].id)}
+		self.assertEqual(self.client.post('/transport/calculate-fare/', data={'otp': old_otp, **fare_data}).status_code, 200)
+
+		self.bus.otp_code = 'ZZ999' if old_otp != 'ZZ999' else 'YY888'
+		self.bus.save()
+		self.assertEqual(self.client.post('/transport/calculate-fare/', data={'otp': old_otp, **fare_data}).status_code, 400)
+		self.assertEqual(self.client.post('/transport/calculate-fare/', data={'otp': self.bus.otp_code, **fare_data}).status_code, 200)
+
+	def test_stop_edits_invalidate_route_cache(self):
+		fare_data = {'otp': self.bus.otp_code, 'source': str(self.stops[0].id), 'destination': str(self.stops[4].id)}
+		self.assertEqual(self.client.post('/transport/calculate-fare/', data=fare_data).json().get('fare'), 11.0)
+
+		# Pulling S4 back next to S3 shortens the trip to ~2.4km => 10.
+		last = self.stops[4]
+		last.latitude = 0.0217
+		last.save()
+		self.assertEqual(self.client.post('/transport/calculate-fare/', data=fare_data).json().get('fare'), 10.0)
+
+		# Moving it to another route removes it from the old route straight away.
+		other = Route.objects.create(name='R2', source='C', destination='D')
+		last.route = other
+		last.save()
+		old_ids = [s['id'] for s in self.client.get(f'/transport/get-route-stops/{self.route.id}/').json()['stops']]
+		new_ids = [s['id'] for s in self.client.get(f'/transport/get-route-stops/{other.id}/').json()['stops']]
+		self.assertNotIn(last.id, old_ids)
+		self.assertEqual(new_ids, [last.id])
+		self.assertEqual(self.client.post('/transport/calculate-fare/', data=fare_data).status_code, 400)
+
+	def test_bus_route_name_follows_route(self):
+		with self.assertNumQueries(1):  # a brand-new route has no buses to sync
+			other = Route.objects.create(name='R2', source='C', destination='D')
+
+		self.bus.route_id = other.id
+		self.bus.save(update_fields=['route_id'])
+		self.bus.refresh_from_db()
+		self.assertEqual(self.bus.route_name, 'R2')
+
+		other.name = 'R2 Express'
+		other.save()
+		self.bus.refresh_from_db()
+		self.assertEqual(self.bus.route_name, 'R2 Express')
+
 	def test_booking_requires_different_stops(self):
 		passenger = User.objects.create_user(username='p1', password='pw', role='passenger')
 		self.client.force_login(passenger)
 
-		before = Ticket.objects.count()
 		res = self.client.post(
 			'/transport/book-ticket/',
 			data={'otp': self.bus.otp_code, 'source': str(self.stops[1].id), 'destination': str(self.stops[1].id)},
 			follow=False,
 		)
 		self.assertEqual(res.status_code, 302)
-		self.assertEqual(Ticket.objects.count(), before)
+		self.assertFalse(Ticket.objects.filter(user=passenger).exists())
 
-	def test_driver_trip_summary_backfills_missing_bustrip(self):
+	def test_driver_trip_summary_lists_active_trip_tickets(self):
 		driver = User.objects.create_user(username='d1', password='pw', role='driver')
 		DriverBusAssignment.objects.create(user=driver, bus=self.bus, active=True, start_time=timezone.now())
 
-		# Simulate old logic: trip flag set but no BusTrip row.
 		start = timezone.now() - timedelta(minutes=10)
+		trip = BusTrip.objects.create(bus=self.bus, start_time=start)
 		self.bus.trip_active = True
 		self.bus.trip_start_time = start
-		self.bus.save(update_fields=['trip_active', 'trip_start_time'])
+		self.bus.active_trip = trip
+		self.bus.save(update_fields=['trip_active', 'trip_start_time', 'active_trip'])
 
 		passenger = User.objects.create_user(username='p2', password='pw', role='passenger')
 		Ticket.objects.create(
@@ -96,17 +148,116 @@ class KbusSmokeTests(TestCase):
 			expires_at=timezone.now() + timedelta(minutes=30),
 		)
 
-		self.assertEqual(BusTrip.objects.filter(bus=self.bus).count(), 0)
-
 		self.client.force_login(driver)
 		res = self.client.get(f'/transport/driver-trip-summary/{self.bus.id}/')
 		self.assertEqual(res.status_code, 200)
 		payload = res.json()
 		self.assertTrue(payload.get('trip_active'))
-		self.assertGreaterEqual(len(payload.get('tickets', [])), 1)
+		self.assertEqual(len(payload.get('tickets', [])), 1)
+		self.assertEqual(payload.get('total_amount'), 11.0)
 
-		# Backfill should have created an open trip.
-		self.assertEqual(BusTrip.objects.filter(bus=self.bus, end_time__isnull=True).count(), 1)
+	def test_driver_trips_summary_batches_assigned_buses(self):
+		driver = User.objects.create_user(username='d4', password='pw', role='driver')
+		idle = Bus.objects.create(
+			vehicle_number='KL07AB9999',
+			operator_type='private',
+			operator_name='operator',
+			route=self.route,
+			base_fare='10.00',
+		)
+		for bus in (self.bus, idle):
+			DriverBusAssignment.objects.create(user=driver, bus=bus, active=True, start_time=timezone.now())
+
+		trip = BusTrip.objects.create(bus=self.bus, start_time=timezone.now() - timedelta(minutes=5))
+		Bus.objects.filter(pk=self.bus.pk).update(trip_active=True, trip_start_time=trip.start_time, active_trip=trip)
+		for fare in ('10.00', '12.50'):
+			Ticket.objects.create(
+				user=driver,
+				bus=self.bus,
+				source_stop=self.stops[0].name,
+				destination_stop=self.stops[2].name,
+				fare=fare,
+				expires_at=timezone.now(),
+			)
+
+		self.client.force_login(driver)
+		with self.assertNumQueries(4):  # session, user, buses, tickets
+			res = self.client.get('/transport/driver-trips-summary/')
+		self.assertEqual(res.status_code, 200)
+		buses = res.json()['buses']
+		self.assertEqual(list(buses), [str(self.bus.id)])
+		self.assertEqual(buses[str(self.bus.id)]['total_amount'], 22.5)
+		self.assertEqual(len(buses[str(self.bus.id)]['tickets']), 2)
+
+	def test_driver_trip_summary_access(self):
+		stranger = User.objects.create_user(username='d5', password='pw', role='driver')
+		self.client.force_login(stranger)
+		with self.assertNumQueries(3):  # session, user, bus with its access flag
+			self.assertEqual(self.client.get(f'/transport/driver-trip-summary/{self.bus.id}/').status_code, 403)
+		self.assertEqual(self.client.get('/transport/driver-trip-summary/999999/').status_code, 404)
+
+		# Legacy operator_name linkage grants access and records an assignment.
+		owner = User.objects.create_user(username='operator', password='pw', role='driver')
+		self.client.force_login(owner)
+		self.assertEqual(self.client.get(f'/transport/driver-trip-summary/{self.bus.id}/').status_code, 200)
+		self.assertTrue(DriverBusAssignment.objects.filter(user=owner, bus=self.bus, active=True).exists())
+
+	def test_start_and_end_trip(self):
+		driver = User.objects.create_user(username='d2', password='pw', role='driver')
+		DriverBusAssignment.objects.create(user=driver, bus=self.bus, active=True, start_time=timezone.now())
+		self.client.force_login(driver)
+
+		self.client.get(f'/transport/start-trip/{self.bus.id}/')
+		self.bus.refresh_from_db()
+		self.assertTrue(self.bus.trip_active)
+		self.assertIsNotNone(self.bus.active_trip_id)
+
+		# A repeated "end trip" must not record an extra trip.
+		self.client.get(f'/transport/end-trip/{self.bus.id}/')
+		self.client.get(f'/transport/end-trip/{self.bus.id}/')
+		self.bus.refresh_from_db()
+		self.assertFalse(self.bus.trip_active)
+		self.assertIsNone(self.bus.active_trip_id)
+		self.assertEqual(BusTrip.objects.filter(bus=self.bus).count(), 1)
+		self.assertFalse(BusTrip.objects.filter(bus=self.bus, end_time__isnull=True).exists())
+
+	def test_closed_trip_details_are_cached(self):
+		cache.clear()
+		driver = User.objects.create_user(username='d3', password='pw', role='driver')
+		DriverBusAssignment.objects.create(user=driver, bus=self.bus, active=True, start_time=timezone.now())
+		now = timezone.now()
+		trip = BusTrip.objects.create(bus=self.bus, start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1))
+		Ticket.objects.create(
+			user=driver,
+			bus=self.bus,
+			source_stop=self.stops[0].name,
+			destination_stop=self.stops[1].name,
+			fare='10.00',
+			expires_at=now,
+		)
+		self.client.force_login(driver)
+
+		res = self.client.get(f'/transport/driver-trip/{trip.id}/')
+		self.assertEqual(res.status_code, 200)
+		self.assertEqual(res.json()['total_amount'], 10.0)
+
+		with self.assertNumQueries(3):  # session, user, trip with its access check; no ticket queries
+			res2 = self.client.get(f'/transport/driver-trip/{trip.id}/')
+		self.assertEqual(res2.json(), res.json())
+
+		res3 = self.client.get(f'/transport/driver-trip/{trip.id}/', HTTP_IF_NONE_MATCH=res['ETag'])
+		self.assertEqual(res3.status_code, 304)
+		self.assertEqual(res3['ETag'], res['ETag'])
+
+	def test_route_kml_respects_accept_encoding(self):
+		res = self.client.get('/transport/route-kml/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+		self.assertEqual(res.status_code, 200)
+		self.assertEqual(res['Content-Encoding'], 'gzip')
+
+		res = self.client.get('/transport/route-kml/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+		self.assertEqual(res.status_code, 200)
+		self.assertFalse(res.has_header('Content-Encoding'))
+		res.close()
 
 	def test_bus_location_endpoints(self):
 		# No location yet
@@ -127,22 +278,37 @@ class KbusSmokeTests(TestCase):
 		self.assertIn('lat', res3.json())
 		self.assertTrue(BusLiveLocation.objects.filter(bus=self.bus).exists())
 
-	def test_register_validation_missing_and_duplicate(self):
-		before = User.objects.count()
+	def test_update_location_skips_jitter(self):
+		url = f'/transport/update-location/{self.bus.id}/'
+		self.client.post(url, data={'lat': '10.0', 'lng': '76.0', 'speed': '0'})
+		loc = BusLiveLocation.objects.get(bus=self.bus)
+
+		# ~1 m away, immediately after: treated as GPS jitter.
+		res = self.client.post(url, data={'lat': '10.00001', 'lng': '76.0', 'speed': '0'})
+		self.assertEqual(res.status_code, 200)
+		self.assertTrue(res.json().get('skipped'))
+		loc.refresh_from_db()
+		self.assertEqual(loc.latitude, 10.0)
 
+		# A real move is stored.
+		res2 = self.client.post(url, data={'lat': '10.001', 'lng': '76.0', 'speed': '0'})
+		self.assertNotIn('skipped', res2.json())
+		loc.refresh_from_db()
+		self.assertEqual(loc.latitude, 10.001)
+
+	def test_register_validation_missing_and_duplicate(self):
 		res = self.client.post('/transport/register/', data={'username': '', 'password': '', 'confirm_password': ''})
 		self.assertEqual(res.status_code, 200)
-		self.assertEqual(User.objects.count(), before)
+		self.assertFalse(User.objects.filter(username='').exists())
 		self.assertContains(res, 'required')
 
 		res2 = self.client.post('/transport/register/', data={'username': 'u1', 'password': 'pw1234', 'confirm_password': 'pw1234'})
 		self.assertEqual(res2.status_code, 302)
 		self.assertTrue(User.objects.filter(username='u1').exists())
 
-		before2 = User.objects.count()
 		res3 = self.client.post('/transport/register/', data={'username': 'u1', 'password': 'pw1234', 'confirm_password': 'pw1234'})
 		self.assertEqual(res3.status_code, 200)
-		self.assertEqual(User.objects.count(), before2)
+		self.assertEqual(User.objects.filter(username='u1').count(), 1)
 		self.assertContains(res3, 'already')
 
 	def test_admin_form_validation_stop_and_bus(self):
@@ -150,18 +316,16 @@ class KbusSmokeTests(TestCase):
 		self.client.force_login(admin)
 
 		# Invalid stop (missing route_id)
-		before_stops = Stop.objects.count()
 		res = self.client.post('/transport/add-stop/', data={'route_id': '', 'name': 'X', 'order': '1', 'latitude': '0', 'longitude': '0'})
 		self.assertEqual(res.status_code, 302)
-		self.assertEqual(Stop.objects.count(), before_stops)
+		self.assertFalse(Stop.objects.filter(name='X').exists())
 
 		# Invalid stop (bad lat)
 		res2 = self.client.post('/transport/add-stop/', data={'route_id': str(self.route.id), 'name': 'X', 'order': '1', 'latitude': '999', 'longitude': '0'})
 		self.assertEqual(res2.status_code, 302)
-		self.assertEqual(Stop.objects.count(), before_stops)
+		self.assertFalse(Stop.objects.filter(name='X').exists())
 
 		# Invalid bus (bad base fare)
-		before_buses = Bus.objects.count()
 		res3 = self.client.post('/transport/register-bus/', data={
 			'vehicle_number': 'X1',
 			'operator_type': 'private',
@@ -170,7 +334,7 @@ class KbusSmokeTests(TestCase):
 			'base_fare': 'abc',
 		})
 		self.assertEqual(res3.status_code, 302)
-		self.assertEqual(Bus.objects.count(), before_buses)
+		self.assertFalse(Bus.objects.filter(vehicle_number='X1').exists())
 
 	def test_update_location_rejects_invalid_range(self):
 		res = self.client.post(f'/transport/update-location/{self.bus.id}/', data={'lat': '999', 'lng': '0', 'speed': '0'})
@@ -192,3 +356,21 @@ class KbusSmokeTests(TestCase):
 		res = self.client.get('/transport/passenger/')
 		self.assertEqual(res.status_code, 200)
 		self.assertContains(res, f'Ticket #{ticket.id}')
+
+	def test_admin_dashboard_pages_tickets(self):
+		admin = User.objects.create_user(username='admin2', password='pw12', role='admin')
+		passenger = User.objects.create_user(username='p4', password='pw', role='passenger')
+		Ticket.objects.bulk_create([
+			Ticket(user=passenger, bus=self.bus, source_stop='S0', destination_stop='S1', fare='10.00')
+			for _ in range(60)
+		])
+		self.client.force_login(admin)
+
+		res = self.client.get('/transport/admin-dashboard/')
+		self.assertEqual(res.status_code, 200)
+		self.assertEqual(len(res.context['tickets']), 50)
+		self.assertContains(res, 'Page 1 of 2')
+
+		res2 = self.client.get('/transport/admin-dashboard/', {'tickets_page': 2})
+		self.assertEqual(len(res2.context['tickets']), 10)
+		self.assertEqual(res2.context['open_table'], 'tickets_tbl')
@@ -40,6 +40,7 @@ urlpatterns = [
 
     path('driver-dashboard/', driver_dashboard, name='driver_dashboard'),
     path('driver-trip-summary/<int:bus_id>/', driver_trip_summary, name='driver_trip_summary'),
+    path('driver-trips-summary/', driver_trips_summary, name='driver_trips_summary'),
     path('driver-trip/<int:trip_id>/', driver_trip_details, name='driver_trip_details'),
     path('start-trip/<int:bus_id>/', start_trip, name='start_trip'),
     path('end-trip/<int:bus_id>/', end_trip, name='end_trip'),
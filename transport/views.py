@@ -1,24 +1,36 @@
 from __future__ import annotations
 
+import bisect
+import gzip
+import hashlib
 import json
 import math
-import re
-from decimal import Decimal, ROUND_CEILING
+import os
+from decimal import Decimal
 from datetime import timedelta
 
 from django.contrib import messages
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.utils import OperationalError
-from django.db.models import Sum
-from django.http import Http404, HttpResponse, JsonResponse
+from django.db.models import BooleanField, Case, Exists, F, FloatField, OuterRef, Q, Value, When, Window
+from django.db.models.functions import Cast, RowNumber
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_http_methods
 
+from .geo import distance_meters, equirect_distances_from, haversine_rad_m
 from .models import (
+    OTP_ALPHABET,
+    OTP_LENGTH,
     Bus,
     BusLiveLocation,
     BusTrip,
@@ -28,6 +40,54 @@ from .models import (
     Stop,
     Ticket,
 )
+from .responses import CompactJsonResponse, OrjsonResponse
+from .route_cache import get_route_stops_cached, route_stop_lookup, route_view
+
+
+_KML_NAME = 'maps/K-BUS Route.kml'
+_KML_CONTENT_TYPE = 'application/vnd.google-earth.kml+xml; charset=utf-8'
+
+
+_kml_info = None
+
+
+def _kml_file_info():
+    """Locates the route KML once per process and fingerprints it for conditional GETs.
+
+    Returns (path, etag, last_modified, gzipped_bytes), or None if the file is missing.
+    Misses are not cached, so a KML added after startup is picked up.
+    """
+    global _kml_info
+    if _kml_info is not None:
+        return _kml_info
+    kml_path = finders.find(_KML_NAME)
+    if not kml_path:
+        return None
+    with open(kml_path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.blake2b(content, digest_size=8).hexdigest()
+    _kml_info = (kml_path, digest, int(os.path.getmtime(kml_path)), gzip.compress(content, mtime=0))
+    return _kml_info
+
+
+def _accepts_gzip(accept_encoding):
+    """True unless the client refuses gzip, honouring q-values (`gzip;q=0`, `*;q=0`)."""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
 
 
 @require_GET
@@ -38,29 +98,29 @@ def kbus_route_kml(request):
     not running or static hosting misconfigured), which would make map stop markers vanish.
     """
 
-    kml_path = finders.find('maps/K-BUS Route.kml')
-    if not kml_path:
+    info = _kml_file_info()
+    if info is None:
         raise Http404('KML not found')
-
-    with open(kml_path, 'rb') as f:
-        content = f.read()
-
-    resp = HttpResponse(content, content_type='application/vnd.google-earth.kml+xml; charset=utf-8')
+    kml_path, digest, last_modified, gzipped = info
+
+    use_gzip = _accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    etag = f'"{digest}-gz"' if use_gzip else f'"{digest}"'
+
+    resp = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if resp is None:
+        if use_gzip:
+            resp = HttpResponse(gzipped, content_type=_KML_CONTENT_TYPE)
+            resp['Content-Encoding'] = 'gzip'
+        else:
+            # FileResponse lets the WSGI server use sendfile() where available.
+            resp = FileResponse(open(kml_path, 'rb'), content_type=_KML_CONTENT_TYPE)
+    resp['ETag'] = etag
+    resp['Last-Modified'] = http_date(last_modified)
     resp['Cache-Control'] = 'public, max-age=3600'
+    patch_vary_headers(resp, ('Accept-Encoding',))
     return resp
 
 
-def distance_meters(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1 = math.radians(float(lat1))
-    phi2 = math.radians(float(lat2))
-    dphi = math.radians(float(lat2) - float(lat1))
-    dlambda = math.radians(float(lon2) - float(lon1))
-
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
-
-
 def _estimate_speed_mps(prev_lat, prev_lng, prev_time, lat, lng, now_time):
     if prev_lat is None or prev_lng is None or prev_time is None:
         return 0.0
@@ -81,106 +141,94 @@ def _route_remaining_distance_m(bus, lat, lng):
 
     remaining_path_m includes: current position -> next stop + subsequent stop-to-stop distances.
     """
-    stops = list(Stop.objects.filter(route=bus.route).order_by('order', 'id'))
+    stops = get_route_stops_cached(bus.route_id)
     if not stops:
         return (None, None, None)
 
-    current = None
-    if bus.current_stop:
-        for s in stops:
-            if s.name == bus.current_stop:
-                current = s
-                break
+    view = route_view(bus.route_id)
+    phi = math.radians(lat)
+    lam = math.radians(lng)
+    cos_phi = math.cos(phi)
+
+    current = route_stop_lookup(bus.route_id)[1].get(bus.current_stop) if bus.current_stop else None
 
     if current is None:
-        next_stop = stops[0]
-        remaining = distance_meters(lat, lng, next_stop.latitude, next_stop.longitude)
-        return (next_stop, remaining, remaining)
+        remaining = haversine_rad_m(phi, lam, cos_phi, view.lat_rad[0], view.lon_rad[0], view.cos_lat[0])
+        return (stops[0], remaining, remaining)
 
-    remaining_stops = [s for s in stops if s.order > current.order]
-    if not remaining_stops:
+    # Stops are sorted by order, so the first one past the current stop is a binary search.
+    next_index = bisect.bisect_right(view.orders, current.order)
+    if next_index == len(stops):
         return (None, 0.0, 0.0)
 
-    next_stop = remaining_stops[0]
-    dist_to_next = distance_meters(lat, lng, next_stop.latitude, next_stop.longitude)
-    path = dist_to_next
-
-    prev = next_stop
-    for s in remaining_stops[1:]:
-        path += distance_meters(prev.latitude, prev.longitude, s.latitude, s.longitude)
-        prev = s
-
-    return (next_stop, dist_to_next, path)
+    dist_to_next = haversine_rad_m(
+        phi, lam, cos_phi, view.lat_rad[next_index], view.lon_rad[next_index], view.cos_lat[next_index],
+    )
+    path = dist_to_next + (view.cum[-1] - view.cum[next_index])
 
+    return (stops[next_index], dist_to_next, path)
 
-def _route_path_distance_m(route, source_stop: Stop, dest_stop: Stop) -> float:
-    stops = list(Stop.objects.filter(route=route).order_by('order', 'id'))
-    if not stops:
-        return float(distance_meters(source_stop.latitude, source_stop.longitude, dest_stop.latitude, dest_stop.longitude))
 
-    id_to_index = {s.id: i for i, s in enumerate(stops)}
-    i_src = id_to_index.get(source_stop.id)
-    i_dst = id_to_index.get(dest_stop.id)
+def _route_path_distance_m(route_id: int, source_stop, dest_stop) -> float:
+    view = route_view(route_id)
+    i_src = view.pos.get(source_stop.id)
+    i_dst = view.pos.get(dest_stop.id)
     if i_src is None or i_dst is None:
         return float(distance_meters(source_stop.latitude, source_stop.longitude, dest_stop.latitude, dest_stop.longitude))
 
-    if i_src == i_dst:
-        return 0.0
+    return float(abs(view.cum[i_dst] - view.cum[i_src]))
 
-    a_i = min(i_src, i_dst)
-    b_i = max(i_src, i_dst)
 
-    total = 0.0
-    for i in range(a_i, b_i):
-        a = stops[i]
-        b = stops[i + 1]
-        total += float(distance_meters(a.latitude, a.longitude, b.latitude, b.longitude))
-    return float(total)
+_BASE_FARE = Decimal('10')
 
 
 def _fare_from_distance_m(distance_m: float) -> Decimal:
     # Pricing rule:
     # - Up to 2.5 km => ₹10
     # - After 2.5 km => +₹1 for each additional started 1 km
-    base_km = Decimal('2.5')
-    base_fare = Decimal('10')
-
     try:
-        km = (Decimal(str(distance_m)) / Decimal('1000'))
-    except Exception:
-        return base_fare
+        # ceil(ceil(x) / n) == ceil(x / n), so rounding up to whole metres first is exact.
+        meters = math.ceil(float(distance_m))
+    except (TypeError, ValueError, OverflowError):
+        return _BASE_FARE
 
-    if km <= base_km:
-        return base_fare
+    if meters <= 2500:
+        return _BASE_FARE
 
-    extra_km = km - base_km
-    # started-km charging: ceil(extra_km)
-    extra_units = int(extra_km.to_integral_value(rounding=ROUND_CEILING))
-    return (base_fare + Decimal(extra_units)).quantize(Decimal('0.01'))
+    # started-km charging: ceil((meters - 2500) / 1000)
+    extra_units = -(-(meters - 2500) // 1000)
+    return _BASE_FARE + extra_units
 
 
 User = get_user_model()
 
 
-_OTP_RE = re.compile(r'^[A-Z0-9]{5}$')
+# Validation mirrors generate_otp() so the two can't drift apart.
+_OTP_CHARS = frozenset(OTP_ALPHABET)
 
 
 def _normalize_bus_otp(value) -> str | None:
     if value is None:
         return None
-    otp = str(value).strip().upper()
-    if not otp:
-        return None
-    if not _OTP_RE.fullmatch(otp):
+    if not isinstance(value, str):
+        value = str(value)
+    otp = value.strip().upper()
+    # Equivalent to fullmatch('[A-Z0-9]{5}') without the regex engine; the explicit
+    # ASCII set also rejects Unicode letters/digits that str.isalnum() would accept.
+    if len(otp) != OTP_LENGTH or not _OTP_CHARS.issuperset(otp):
         return None
     return otp
 
 
 def _to_int(value, *, min_value: int | None = None, max_value: int | None = None):
-    try:
-        i = int(str(value).strip())
-    except Exception:
-        return None
+    # Fast path for values that are already ints (bools deliberately excluded).
+    if type(value) is int:
+        i = value
+    else:
+        try:
+            i = int(value.strip() if isinstance(value, str) else str(value).strip())
+        except Exception:
+            return None
     if min_value is not None and i < min_value:
         return None
     if max_value is not None and i > max_value:
@@ -189,10 +237,13 @@ def _to_int(value, *, min_value: int | None = None, max_value: int | None = None
 
 
 def _to_float(value, *, min_value: float | None = None, max_value: float | None = None):
-    try:
-        f = float(str(value).strip())
-    except Exception:
-        return None
+    if type(value) is float or type(value) is int:
+        f = float(value)
+    else:
+        try:
+            f = float(value.strip() if isinstance(value, str) else str(value).strip())
+        except Exception:
+            return None
     if min_value is not None and f < min_value:
         return None
     if max_value is not None and f > max_value:
@@ -201,15 +252,27 @@ def _to_float(value, *, min_value: float | None = None, max_value: float | None
 
 
 def _to_decimal(value, *, min_value: Decimal | None = None):
-    try:
-        d = Decimal(str(value).strip())
-    except Exception:
-        return None
+    if type(value) is Decimal:
+        d = value
+    else:
+        try:
+            d = Decimal(value.strip() if isinstance(value, str) else str(value).strip())
+        except Exception:
+            return None
     if min_value is not None and d < min_value:
         return None
     return d
 
 
+def _resolve_stop(route_id, value):
+    """Finds a stop on the route by id, or else by name, from the route cache."""
+    by_id, by_name = route_stop_lookup(route_id)
+    stop_id = _to_int(value, min_value=1)
+    if stop_id:
+        return by_id.get(stop_id)
+    return by_name.get(value)
+
+
 def kbus_view(request):
     if not request.user.is_authenticated:
         return redirect('login')
@@ -294,15 +357,16 @@ def validate_bus_otp(request, otp=None):
         messages.error(request, 'Enter OTP')
         return redirect('passenger')
 
-    bus = Bus.objects.filter(otp_code=otp).first()
-    if not bus:
+    bus_ids = Bus.by_otp(otp)
+    if not bus_ids:
         if request.method == 'GET' and otp is not None:
             return JsonResponse({'valid': False, 'error': 'Invalid OTP'}, status=400)
         messages.error(request, 'Invalid OTP')
         return redirect('passenger')
 
     if request.method == 'GET' and otp is not None:
-        return JsonResponse({'valid': True, 'otp': otp, 'bus_id': bus.id})
+        bus_id, _route_id = bus_ids
+        return JsonResponse({'valid': True, 'otp': otp, 'bus_id': bus_id})
 
     return redirect('passenger_select', otp=otp)
 
@@ -314,8 +378,7 @@ def passenger_select(request, otp):
         messages.error(request, 'Invalid OTP')
         return redirect('passenger')
 
-    bus = Bus.objects.filter(otp_code=otp).first()
-    if not bus:
+    if not Bus.by_otp(otp):
         messages.error(request, 'Invalid OTP')
         return redirect('passenger')
     routes = Route.objects.all()
@@ -339,16 +402,14 @@ def bus_ticket(request):
         messages.error(request, 'Please select source and destination')
         return redirect('passenger')
 
-    bus = Bus.objects.filter(otp_code=otp).first()
-    if not bus:
+    bus_ids = Bus.by_otp(otp)
+    if not bus_ids:
         messages.error(request, 'Invalid OTP')
         return redirect('passenger')
+    bus_id, route_id = bus_ids
 
-    stops = Stop.objects.filter(route=bus.route)
-    source_id = _to_int(source, min_value=1)
-    dest_id = _to_int(destination, min_value=1)
-    source_stop = stops.filter(id=source_id).first() if source_id else stops.filter(name=source).order_by('order', 'id').first()
-    dest_stop = stops.filter(id=dest_id).first() if dest_id else stops.filter(name=destination).order_by('order', 'id').first()
+    source_stop = _resolve_stop(route_id, source)
+    dest_stop = _resolve_stop(route_id, destination)
 
     if not source_stop or not dest_stop:
         messages.error(request, 'Stop not found')
@@ -358,20 +419,25 @@ def bus_ticket(request):
         messages.error(request, 'Source and destination cannot be the same stop')
         return redirect('passenger_select', otp=otp)
 
-    distance_m = _route_path_distance_m(bus.route, source_stop, dest_stop)
+    distance_m = _route_path_distance_m(route_id, source_stop, dest_stop)
     fare = _fare_from_distance_m(distance_m)
-    ticket = Ticket.objects.create(
-        user=request.user,
-        bus=bus,
-        source_stop=source_stop.name,
-        destination_stop=dest_stop.name,
-        fare=fare,
-        expires_at=timezone.now() + timedelta(minutes=30),
-    )
+    # The post_save handler bumps the trip's running totals; commit both together.
+    with transaction.atomic():
+        ticket = Ticket.objects.create(
+            user=request.user,
+            bus_id=bus_id,
+            source_stop=source_stop.name,
+            destination_stop=dest_stop.name,
+            fare=fare,
+            expires_at=timezone.now() + timedelta(minutes=30),
+        )
 
     return redirect('ticket_view', ticket_id=ticket.id)
 
 
+ADMIN_PAGE_SIZE = 50
+
+
 def _require_admin(request):
     if getattr(request.user, 'role', None) != 'admin':
         messages.error(request, 'Admin only')
@@ -384,18 +450,35 @@ def admin_dashboard(request):
     if not _require_admin(request):
         return redirect('login')
     routes = Route.objects.all()
-    stops = Stop.objects.all()
-    buses = Bus.objects.all()
-    users = User.objects.all()
-    drivers = User.objects.filter(role='driver').order_by('username')
-    tickets = Ticket.objects.all()
+    stops = Stop.objects.select_related('route').only(
+        'id', 'name', 'order', 'latitude', 'longitude', 'route__id', 'route__name',
+    )
+    buses = Bus.objects.only('id', 'vehicle_number', 'operator_name', 'route_name', 'base_fare', 'otp_code')
+    users = User.objects.only('id', 'username', 'role').order_by('id')
+    drivers = User.objects.filter(role='driver').only('id', 'username').order_by('username')
+    tickets = (
+        Ticket.objects.select_related('user', 'bus')
+        .only('id', 'source_stop', 'destination_stop', 'fare', 'user__username', 'bus__vehicle_number')
+        .order_by('-created_at', '-id')
+    )
+
+    # Users and tickets grow without bound; page them instead of rendering every row.
+    users_page = Paginator(users, ADMIN_PAGE_SIZE).get_page(request.GET.get('users_page'))
+    tickets_page = Paginator(tickets, ADMIN_PAGE_SIZE).get_page(request.GET.get('tickets_page'))
+    open_table = None
+    if 'tickets_page' in request.GET:
+        open_table = 'tickets_tbl'
+    elif 'users_page' in request.GET:
+        open_table = 'users_tbl'
+
     return render(request, 'admin_dashboard.html', {
         'routes': routes,
         'stops': stops,
         'buses': buses,
-        'users': users,
+        'users': users_page,
         'drivers': drivers,
-        'tickets': tickets,
+        'tickets': tickets_page,
+        'open_table': open_table,
     })
 
 
@@ -538,19 +621,22 @@ def assign_driver_bus(request):
         messages.error(request, 'Select a driver and a bus')
         return redirect('admin_dashboard')
 
-    driver = User.objects.filter(id=driver_id, role='driver').first()
-    if not driver:
-        messages.error(request, 'Driver not found')
-        return redirect('admin_dashboard')
-
-    bus = Bus.objects.filter(id=bus_id).first()
+    bus = Bus.objects.filter(id=bus_id).only('id', 'vehicle_number').first()
     if not bus:
         messages.error(request, 'Bus not found')
         return redirect('admin_dashboard')
 
-    now = timezone.now()
-    DriverBusAssignment.objects.filter(user=driver, active=True, end_time__isnull=True).update(active=False, end_time=now)
-    DriverBusAssignment.objects.create(user=driver, bus=bus, active=True, start_time=now)
+    with transaction.atomic():
+        # Locking the driver row serialises concurrent assignments for the same driver,
+        # so two POSTs cannot both leave an active row behind.
+        driver = User.objects.select_for_update().filter(id=driver_id, role='driver').first()
+        if not driver:
+            messages.error(request, 'Driver not found')
+            return redirect('admin_dashboard')
+
+        now = timezone.now()
+        DriverBusAssignment.objects.filter(user=driver, active=True, end_time__isnull=True).update(active=False, end_time=now)
+        DriverBusAssignment.objects.create(user=driver, bus=bus, active=True, start_time=now)
 
     messages.success(request, f'Assigned {driver.username} to {bus.vehicle_number}')
     return redirect('admin_dashboard')
@@ -562,22 +648,16 @@ def get_stops_by_otp(request, otp):
         if not otp:
             return JsonResponse({'error': 'Invalid OTP'}, status=400)
 
-        bus = Bus.objects.get(otp_code=otp)
-        stops = Stop.objects.filter(route=bus.route).order_by('order')
+        bus = Bus.objects.only('id', 'vehicle_number', 'route_id', 'route_name').get(otp_code=otp)
+        stop_list = [
+            {'name': s.name, 'latitude': s.latitude, 'longitude': s.longitude, 'order': s.order}
+            for s in get_route_stops_cached(bus.route_id)
+        ]
 
-        stop_list = []
-        for s in stops:
-            stop_list.append({
-                'name': s.name,
-                'latitude': s.latitude,
-                'longitude': s.longitude,
-                'order': s.order,
-            })
-
-        return JsonResponse({
+        return CompactJsonResponse({
             'bus_id': bus.id,
             'bus_number': bus.vehicle_number,
-            'route_name': bus.route.name,
+            'route_name': bus.route_name,
             'stops': stop_list,
         })
     except Bus.DoesNotExist:
@@ -599,16 +679,13 @@ def calculate_fare(request):
     if not (source and destination):
         return JsonResponse({'error': 'Missing fields'}, status=400)
 
-    bus = Bus.objects.filter(otp_code=otp).first()
-    if not bus:
+    bus_ids = Bus.by_otp(otp)
+    if not bus_ids:
         return JsonResponse({'error': 'Invalid OTP'}, status=400)
+    _bus_id, route_id = bus_ids
 
-    stops = Stop.objects.filter(route=bus.route)
-
-    source_id = _to_int(source, min_value=1)
-    dest_id = _to_int(destination, min_value=1)
-    source_stop = stops.filter(id=source_id).first() if source_id else stops.filter(name=source).order_by('order', 'id').first()
-    dest_stop = stops.filter(id=dest_id).first() if dest_id else stops.filter(name=destination).order_by('order', 'id').first()
+    source_stop = _resolve_stop(route_id, source)
+    dest_stop = _resolve_stop(route_id, destination)
 
     if not source_stop or not dest_stop:
         return JsonResponse({'error': 'Stop not found'}, status=400)
@@ -616,7 +693,7 @@ def calculate_fare(request):
     if source_stop.id == dest_stop.id:
         return JsonResponse({'error': 'Source and destination cannot be the same stop'}, status=400)
 
-    distance_m = _route_path_distance_m(bus.route, source_stop, dest_stop)
+    distance_m = _route_path_distance_m(route_id, source_stop, dest_stop)
     fare = _fare_from_distance_m(distance_m)
     return JsonResponse({'fare': float(fare)})
 
@@ -626,18 +703,22 @@ def my_tickets(request, user_id):
     if getattr(request.user, 'role', None) != 'admin' and request.user.id != user_id:
         return JsonResponse({'error': 'Forbidden'}, status=403)
 
-    tickets = Ticket.objects.filter(user_id=user_id)
-    data = []
-    for t in tickets:
-        data.append({
-            'ticket_id': t.id,
-            'bus': t.bus.vehicle_number,
-            'source': t.source_stop,
-            'destination': t.destination_stop,
-            'fare': float(t.fare),
-            'created_at': t.created_at,
-        })
-    return JsonResponse({'tickets': data})
+    rows = Ticket.objects.filter(user_id=user_id).values_list(
+        'id', 'bus__vehicle_number', 'source_stop', 'destination_stop', 'fare', 'created_at',
+    )
+    data = [
+        {
+            'ticket_id': ticket_id,
+            'bus': vehicle_number,
+            'source': source,
+            'destination': destination,
+            'fare': float(fare),
+            'created_at': created_at,
+        }
+        # A passenger's history is unbounded; stream it rather than filling the result cache.
+        for ticket_id, vehicle_number, source, destination, fare, created_at in rows.iterator(chunk_size=500)
+    ]
+    return CompactJsonResponse({'tickets': data})
 
 
 @login_required
@@ -651,9 +732,13 @@ def ticket_view(request, ticket_id):
 
 
 def get_route_stops(request, route_id):
-    stops = Stop.objects.filter(route_id=route_id).order_by('order')
-    data = [{'id': s.id, 'name': s.name} for s in stops]
-    return JsonResponse({'stops': data})
+    data = [{'id': s.id, 'name': s.name} for s in get_route_stops_cached(route_id)]
+    return CompactJsonResponse({'stops': data})
+
+
+# Pings closer than this to the last stored point, in both space and time, are not saved.
+LOCATION_DEADBAND_M = 5.0
+LOCATION_DEADBAND_S = 3.0
 
 
 @csrf_exempt
@@ -662,9 +747,13 @@ def update_bus_location(request, bus_id):
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
     if request.content_type and 'application/json' in request.content_type:
+        body = request.body
         try:
-            payload = json.loads(request.body.decode('utf-8') or '{}')
-        except Exception:
+            # json.loads detects UTF-8/16/32 on bytes itself, so skip the intermediate str copy.
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        if not isinstance(payload, dict):
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
     else:
         payload = request.POST
@@ -676,7 +765,7 @@ def update_bus_location(request, bus_id):
     if lat is None or lng is None:
         return JsonResponse({'error': 'Missing latitude/longitude'}, status=400)
 
-    bus = Bus.objects.filter(id=bus_id).first()
+    bus = Bus.objects.filter(id=bus_id).only('id', 'route_id', 'current_stop').first()
     if not bus:
         return JsonResponse({'error': 'Bus not found'}, status=404)
 
@@ -692,42 +781,51 @@ def update_bus_location(request, bus_id):
     if speed_f < 0:
         speed_f = 0.0
 
-    loc = BusLiveLocation.objects.filter(bus=bus).order_by('-updated_at', '-id').first()
-    prev_lat = loc.latitude if loc else None
-    prev_lng = loc.longitude if loc else None
-    prev_time = loc.updated_at if loc else None
-
-    if loc:
-        loc.latitude = lat_f
-        loc.longitude = lng_f
-        if speed_f <= 0 and prev_time is not None:
-            speed_f = _estimate_speed_mps(prev_lat, prev_lng, prev_time, lat_f, lng_f, timezone.now())
-        loc.speed = speed_f
-        loc.save(update_fields=['latitude', 'longitude', 'speed', 'updated_at'])
-    else:
+    # Only the previous fix is needed (for the dead-band and speed estimate), so skip
+    # building a model instance; the write below is a single UPDATE by primary key.
+    prev = (
+        BusLiveLocation.objects.filter(bus_id=bus.id)
+        .order_by('-updated_at', '-id')
+        .values_list('id', 'latitude', 'longitude', 'updated_at')
+        .first()
+    )
+    now = timezone.now()
+
+    if prev is not None:
+        loc_id, prev_lat, prev_lng, prev_time = prev
+        if (
+            (now - prev_time).total_seconds() < LOCATION_DEADBAND_S
+            and distance_meters(prev_lat, prev_lng, lat_f, lng_f) < LOCATION_DEADBAND_M
+        ):
+            # GPS jitter while stationary: nothing downstream would change, so skip the writes
+            # and the nearest-stop check.
+            return JsonResponse({'status': 'ok', 'skipped': True})
+
         if speed_f <= 0:
-            speed_f = 0.0
-        BusLiveLocation.objects.create(bus=bus, latitude=lat_f, longitude=lng_f, speed=speed_f)
-
-    stops = Stop.objects.filter(route=bus.route)
-    nearest_stop = None
-    nearest_dist = None
-    for stop in stops:
-        dist = distance_meters(lat_f, lng_f, stop.latitude, stop.longitude)
-        if nearest_dist is None or dist < nearest_dist:
-            nearest_dist = dist
-            nearest_stop = stop
-
-    if nearest_stop is not None and nearest_dist is not None and nearest_dist < 50:
-        if bus.current_stop != nearest_stop.name:
-            bus.current_stop = nearest_stop.name
-            bus.save(update_fields=['current_stop'])
+            speed_f = _estimate_speed_mps(prev_lat, prev_lng, prev_time, lat_f, lng_f, now)
+        # update() bypasses auto_now, so updated_at is set explicitly.
+        BusLiveLocation.objects.filter(pk=loc_id).update(
+            latitude=lat_f, longitude=lng_f, speed=speed_f, updated_at=now,
+        )
+    else:
+        BusLiveLocation.objects.create(bus_id=bus.id, latitude=lat_f, longitude=lng_f, speed=speed_f)
+
+    view = route_view(bus.route_id)
+    names = view.names
+    if names:
+        # The snap radius is 50 m, where the flat-earth approximation is well within GPS error.
+        dists = equirect_distances_from(lat_f, lng_f, view.lat_rad, view.lon_rad)
+        # min() and list.index() both scan in C; no per-stop Python comparison.
+        nearest_d = min(dists)
+        nearest_name = names[dists.index(nearest_d)]
+        if nearest_d < 50 and bus.current_stop != nearest_name:
+            Bus.objects.filter(pk=bus.pk).update(current_stop=nearest_name)
 
     return JsonResponse({'status': 'ok'})
 
 
 def get_bus_location(request, bus_id):
-    bus = Bus.objects.filter(id=bus_id).first()
+    bus = Bus.objects.filter(id=bus_id).only('id', 'route_id', 'current_stop').first()
     if not bus:
         return JsonResponse({'error': 'Bus not found'}, status=404)
 
@@ -750,7 +848,7 @@ def get_bus_location(request, bus_id):
         eta_seconds = int(dist_to_next_m / speed_mps)
         eta_minutes = int(round(eta_seconds / 60))
 
-    return JsonResponse({
+    return CompactJsonResponse({
         'lat': float(location.latitude),
         'lng': float(location.longitude),
         'speed': float(location.speed),
@@ -762,26 +860,72 @@ def get_bus_location(request, bus_id):
     })
 
 
-def _driver_can_access_bus(user, bus):
-    if getattr(user, 'role', None) == 'admin':
-        return True
+# Bus columns read by the trip views.
+_DRIVER_BUS_FIELDS = ('id', 'trip_active', 'trip_start_time', 'active_trip')
+
+
+def _ensure_driver_assignment(user, bus_id):
+    """Creates an active assignment of `user` to the bus unless one already exists.
+
+    The driver row is locked so concurrent requests for the same driver create at most one row.
+    """
+    with transaction.atomic():
+        User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True).first()
+        if not DriverBusAssignment.objects.filter(user=user, bus_id=bus_id, active=True, end_time__isnull=True).exists():
+            DriverBusAssignment.objects.create(user=user, bus_id=bus_id, active=True, start_time=timezone.now())
 
-    # New mapping (Option B)
-    if DriverBusAssignment.objects.filter(user=user, bus=bus, active=True, end_time__isnull=True).exists():
-        return True
 
-    # Backward-compat: if old mapping exists, allow and auto-create assignment
-    reg = DriverRegistration.objects.filter(user=user).first()
-    if reg and reg.bus_otp == bus.otp_code:
-        DriverBusAssignment.objects.create(user=user, bus=bus, active=True, start_time=timezone.now())
-        return True
+def _driver_access_q(user, prefix=''):
+    """Q matching buses `user` may drive; `prefix` is the FK path to Bus plus '__', if any.
 
-    # Backward-compat: operator_name based linkage
-    if bus.operator_name == user.username:
-        DriverBusAssignment.objects.create(user=user, bus=bus, active=True, start_time=timezone.now())
-        return True
+    Expects the queryset to carry the `has_assignment` annotation from _fetch_for_driver.
+    """
+    return (
+        # New mapping (Option B)
+        Q(has_assignment=True)
+        # Backward-compat: old OTP registration mapping
+        | Q(**{f'{prefix}otp_code__in': DriverRegistration.objects.filter(user=user).values('bus_otp')})
+        # Backward-compat: operator_name based linkage
+        | Q(**{f'{prefix}operator_name': user.username})
+    )
 
-    return False
+
+def _fetch_for_driver(qs, user, pk, fields, bus_path=None):
+    """Fetches row `pk` of `qs` together with whether `user` may drive its bus.
+
+    Returns (obj, None) or (None, 403/404). The permission check rides on the same query
+    as an annotation, so denied requests cost no extra round trip either.
+    """
+    qs = qs.annotate(has_assignment=Exists(DriverBusAssignment.objects.filter(
+        user=user, bus=OuterRef(bus_path or 'pk'), active=True, end_time__isnull=True,
+    )))
+    if getattr(user, 'role', None) == 'admin':
+        allowed = Value(True)
+    else:
+        allowed = Case(
+            When(_driver_access_q(user, f'{bus_path}__' if bus_path else ''), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+    obj = qs.annotate(driver_allowed=allowed).only(*fields).filter(pk=pk).first()
+    if obj is None:
+        return None, 404
+    if not obj.driver_allowed:
+        return None, 403
+    # Backward-compat: a bus reached through a legacy link gets a real assignment row.
+    if not obj.has_assignment and getattr(user, 'role', None) != 'admin':
+        _ensure_driver_assignment(user, getattr(obj, f'{bus_path}_id') if bus_path else obj.pk)
+    return obj, None
+
+
+def _driver_bus_or_error(user, bus_id, *, lock=False):
+    """Returns (bus, None) for a bus `user` may drive, else (None, 403/404).
+
+    With `lock`, the bus row is locked, which serialises concurrent start/end requests
+    for it; the caller must be inside transaction.atomic().
+    """
+    qs = Bus.objects.select_for_update() if lock else Bus.objects.all()
+    return _fetch_for_driver(qs, user, bus_id, _DRIVER_BUS_FIELDS)
 
 
 @login_required
@@ -801,35 +945,30 @@ def driver_dashboard(request):
         if reg:
             bus = Bus.objects.filter(otp_code=reg.bus_otp).first()
             if bus:
-                DriverBusAssignment.objects.create(user=request.user, bus=bus, active=True, start_time=timezone.now())
+                _ensure_driver_assignment(request.user, bus.id)
         if not bus:
             bus = Bus.objects.filter(operator_name=request.user.username).first()
             if bus:
-                DriverBusAssignment.objects.create(user=request.user, bus=bus, active=True, start_time=timezone.now())
+                _ensure_driver_assignment(request.user, bus.id)
 
     trips = []
     active_trip = None
-    if bus:
-        # Backward-compat: older code toggled Bus.trip_active/trip_start_time without
-        # creating a BusTrip row. Create one lazily so ticket history works.
-        if bus.trip_active:
-            active_trip = BusTrip.objects.filter(bus=bus, end_time__isnull=True).order_by('-start_time', '-id').first()
-            if not active_trip:
-                start_time = bus.trip_start_time or timezone.now()
-                if bus.trip_start_time is None:
-                    bus.trip_start_time = start_time
-                    bus.save(update_fields=['trip_start_time'])
-                active_trip = BusTrip.objects.create(bus=bus, start_time=start_time)
-
-        trips = BusTrip.objects.filter(bus=bus).order_by('-start_time', '-id')
-        if active_trip is None:
-            active_trip = BusTrip.objects.filter(bus=bus, end_time__isnull=True).order_by('-start_time', '-id').first()
-
-    tickets = Ticket.objects.none()
+    tickets = []
     total_amount = 0
-    if bus and bus.trip_active and active_trip:
-        tickets = Ticket.objects.filter(bus=bus, created_at__gte=active_trip.start_time).order_by('-created_at')
-        total_amount = tickets.aggregate(Sum('fare'))['fare__sum'] or 0
+    if bus:
+        # One query for the whole history; the open trip is picked out of it rather than
+        # fetched separately.
+        trips = list(bus.trips.all())
+        active_trip = next((tr for tr in trips if tr.id == bus.active_trip_id), None)
+
+        if bus.trip_active and active_trip:
+            # Every row is rendered anyway, so total them here instead of a separate SUM query.
+            tickets = list(
+                Ticket.objects.filter(bus=bus, created_at__gte=active_trip.start_time)
+                .only('id', 'source_stop', 'destination_stop', 'fare', 'created_at')
+                .order_by('-created_at')
+            )
+            total_amount = sum((t.fare for t in tickets), Decimal('0'))
 
     return render(request, 'driver_dashboard.html', {
         'bus': bus,
@@ -842,128 +981,177 @@ def driver_dashboard(request):
 
 @login_required
 def start_trip(request, bus_id):
-    bus = Bus.objects.filter(id=bus_id).first()
-    if not bus:
-        messages.error(request, 'Bus not found')
-        return redirect('driver_dashboard')
-
-    if not _driver_can_access_bus(request.user, bus):
-        messages.error(request, 'You are not allowed to start this trip')
-        return redirect('driver_dashboard')
+    with transaction.atomic():
+        bus, error = _driver_bus_or_error(request.user, bus_id, lock=True)
+        if error:
+            messages.error(request, 'You are not allowed to start this trip' if error == 403 else 'Bus not found')
+            return redirect('driver_dashboard')
 
-    open_trip = BusTrip.objects.filter(bus=bus, end_time__isnull=True).order_by('-start_time', '-id').first()
-    if open_trip:
-        open_trip.end_time = timezone.now()
-        open_trip.save(update_fields=['end_time'])
+        now = timezone.now()
+        # Close whatever is still open in one UPDATE; no need to load the trip first.
+        BusTrip.objects.filter(bus_id=bus.id, end_time__isnull=True).update(end_time=now)
 
-    trip = BusTrip.objects.create(bus=bus, start_time=timezone.now())
-    bus.trip_active = True
-    bus.trip_start_time = trip.start_time
-    bus.save(update_fields=['trip_active', 'trip_start_time'])
+        trip = BusTrip.objects.create(bus=bus, start_time=now)
+        Bus.objects.filter(pk=bus.pk).update(trip_active=True, trip_start_time=trip.start_time, active_trip=trip)
     return redirect('driver_dashboard')
 
 
 @login_required
 def end_trip(request, bus_id):
-    bus = Bus.objects.filter(id=bus_id).first()
-    if not bus:
-        messages.error(request, 'Bus not found')
-        return redirect('driver_dashboard')
-
-    if not _driver_can_access_bus(request.user, bus):
-        messages.error(request, 'You are not allowed to end this trip')
-        return redirect('driver_dashboard')
+    with transaction.atomic():
+        bus, error = _driver_bus_or_error(request.user, bus_id, lock=True)
+        if error:
+            messages.error(request, 'You are not allowed to end this trip' if error == 403 else 'Bus not found')
+            return redirect('driver_dashboard')
 
-    open_trip = BusTrip.objects.filter(bus=bus, end_time__isnull=True).order_by('-start_time', '-id').first()
-    now = timezone.now()
-    if open_trip:
-        open_trip.end_time = now
-        open_trip.save(update_fields=['end_time'])
-    else:
-        # Backward-compat: if the trip was started using the old flag-only logic,
-        # create the trip record on end so it appears in history.
-        if bus.trip_active:
-            start_time = bus.trip_start_time or now
-            if bus.trip_start_time is None:
-                bus.trip_start_time = start_time
-                bus.save(update_fields=['trip_start_time'])
-            BusTrip.objects.create(bus=bus, start_time=start_time, end_time=now)
-
-    bus.trip_active = False
-    bus.save(update_fields=['trip_active'])
+        now = timezone.now()
+        BusTrip.objects.filter(bus_id=bus.id, end_time__isnull=True).update(end_time=now)
+        Bus.objects.filter(pk=bus.id).update(trip_active=False, active_trip=None)
     return redirect('driver_dashboard')
 
 
+def _trip_ticket_rows(tickets_qs, limit):
+    """Serialises the first `limit` tickets for the driver trip endpoints.
+
+    Totals come from BusTrip.total_fare, so no aggregate is needed here.
+    """
+    rows = (
+        tickets_qs.annotate(fare_f=Cast('fare', FloatField()))
+        .values_list('id', 'source_stop', 'destination_stop', 'fare_f', 'created_at')[:limit]
+        .iterator(chunk_size=100)
+    )
+    # Serialise while streaming so only one chunk of raw rows is alive at a time.
+    return [_ticket_row(*row) for row in rows]
+
+
+def _ticket_row(ticket_id, source_stop, destination_stop, fare, created_at):
+    # Field order matches the values_list() calls in the trip summary views.
+    return {
+        'id': ticket_id,
+        'source_stop': source_stop,
+        'destination_stop': destination_stop,
+        'fare': fare,
+        'created_at': created_at,
+    }
+
+
+# Bounded rather than permanent so superseded entries age out.
+CLOSED_TRIP_CACHE_TTL = 60 * 60
+
+
 @login_required
 def driver_trip_details(request, trip_id):
-    trip = BusTrip.objects.select_related('bus').filter(id=trip_id).first()
-    if not trip:
-        return JsonResponse({'error': 'Trip not found'}, status=404)
-
-    bus = trip.bus
-    if not _driver_can_access_bus(request.user, bus):
-        return JsonResponse({'error': 'Forbidden'}, status=403)
+    trip, error = _fetch_for_driver(
+        BusTrip.objects.all(), request.user, trip_id,
+        ('id', 'bus_id', 'start_time', 'end_time', 'total_fare', 'ticket_count'), bus_path='bus',
+    )
+    if error:
+        return JsonResponse({'error': 'Forbidden' if error == 403 else 'Trip not found'}, status=error)
+
+    # A closed trip's ticket window is fixed, so its payload can be reused. The key and the
+    # ETag are only consulted after the access check above (hence no @condition decorator).
+    # ticket_count in both keys covers tickets later removed through the admin.
+    cache_key = f'trip_details:v1:{trip.id}:{trip.ticket_count}'
+    etag = None
+    if trip.end_time is not None:
+        etag = f'"trip-{trip.id}-{int(trip.end_time.timestamp())}-{trip.ticket_count}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            # RFC 9110 requires the validator on the 304 as well.
+            not_modified['ETag'] = etag
+            return not_modified
+        payload = cache.get(cache_key)
+        if payload is not None:
+            resp = OrjsonResponse(payload)
+            resp['ETag'] = etag
+            return resp
 
     end_time = trip.end_time or timezone.now()
     tickets_qs = Ticket.objects.filter(
-        bus=bus,
+        bus_id=trip.bus_id,
         created_at__gte=trip.start_time,
         created_at__lte=end_time,
     ).order_by('-created_at')
-    total_amount = tickets_qs.aggregate(Sum('fare'))['fare__sum'] or 0
+    payload = {
+        'trip_id': trip.id,
+        'start_time': trip.start_time,
+        'end_time': trip.end_time,
+        'tickets': _trip_ticket_rows(tickets_qs, 500),
+        'total_amount': float(trip.total_fare),
+    }
+    resp = OrjsonResponse(payload)
+    if etag is not None:
+        cache.set(cache_key, payload, CLOSED_TRIP_CACHE_TTL)
+        resp['ETag'] = etag
+    return resp
 
-    tickets = []
-    for t in tickets_qs[:500]:
-        tickets.append({
-            'id': t.id,
-            'source_stop': t.source_stop,
-            'destination_stop': t.destination_stop,
-            'fare': float(t.fare),
-            'created_at': t.created_at.isoformat(),
-        })
 
-    return JsonResponse({
-        'trip_id': trip.id,
-        'start_time': trip.start_time.isoformat(),
-        'end_time': trip.end_time.isoformat() if trip.end_time else None,
-        'tickets': tickets,
-        'total_amount': float(total_amount),
-    })
+TRIP_SUMMARY_TICKET_LIMIT = 200
 
 
 @login_required
 def driver_trip_summary(request, bus_id):
-    bus = Bus.objects.filter(id=bus_id).first()
-    if not bus:
-        return JsonResponse({'error': 'Bus not found'}, status=404)
+    bus, error = _driver_bus_or_error(request.user, bus_id)
+    if error:
+        return JsonResponse({'error': 'Forbidden' if error == 403 else 'Bus not found'}, status=error)
 
-    if not _driver_can_access_bus(request.user, bus):
-        return JsonResponse({'error': 'Forbidden'}, status=403)
-
-    active_trip = BusTrip.objects.filter(bus=bus, end_time__isnull=True).order_by('-start_time', '-id').first()
-    if bus.trip_active and not active_trip:
-        # Backward-compat: trip flags set but no BusTrip row exists.
-        start_time = bus.trip_start_time or timezone.now()
-        if bus.trip_start_time is None:
-            bus.trip_start_time = start_time
-            bus.save(update_fields=['trip_start_time'])
-        active_trip = BusTrip.objects.create(bus=bus, start_time=start_time)
+    # Idle buses are the common polling case: answer from the already-loaded row.
+    if not bus.trip_active or not bus.active_trip_id:
+        return JsonResponse({'trip_active': False, 'tickets': [], 'total_amount': 0})
 
-    if not bus.trip_active or not active_trip:
+    active_trip = BusTrip.objects.filter(pk=bus.active_trip_id).only('id', 'start_time', 'total_fare').first()
+    if not active_trip:
         return JsonResponse({'trip_active': False, 'tickets': [], 'total_amount': 0})
 
     tickets_qs = Ticket.objects.filter(bus=bus, created_at__gte=active_trip.start_time).order_by('-created_at')
-    total_amount = tickets_qs.aggregate(Sum('fare'))['fare__sum'] or 0
+    tickets = _trip_ticket_rows(tickets_qs, TRIP_SUMMARY_TICKET_LIMIT)
 
-    tickets = []
-    for t in tickets_qs[:200]:
-        tickets.append({
-            'id': t.id,
-            'source_stop': t.source_stop,
-            'destination_stop': t.destination_stop,
-            'fare': float(t.fare),
-            'created_at': t.created_at.isoformat(),
-        })
+    return OrjsonResponse({'trip_active': True, 'tickets': tickets, 'total_amount': float(active_trip.total_fare)})
+
+
+@login_required
+def driver_trips_summary(request):
+    """Active-trip summaries for every bus the driver is assigned to, in one poll.
+
+    Same per-bus payload as driver_trip_summary, keyed by bus id, for a fixed two
+    queries regardless of fleet size: buses (with trip totals) and the newest tickets.
+    """
+    buses = list(
+        Bus.objects.filter(
+            driver_assignments__user=request.user,
+            driver_assignments__active=True,
+            driver_assignments__end_time__isnull=True,
+            trip_active=True,
+            active_trip__isnull=False,
+        )
+        .select_related('active_trip')
+        .only('id', 'active_trip__id', 'active_trip__start_time', 'active_trip__total_fare')
+        .distinct()
+    )
+    if not buses:
+        return OrjsonResponse({'buses': {}})
+
+    # Each bus has its own trip window, so OR the per-bus ranges together.
+    window = Q()
+    for bus in buses:
+        window |= Q(bus_id=bus.id, created_at__gte=bus.active_trip.start_time)
+    tickets_qs = Ticket.objects.filter(window)
+
+    rows = (
+        tickets_qs.annotate(
+            fare_f=Cast('fare', FloatField()),
+            rank=Window(RowNumber(), partition_by=F('bus_id'), order_by=F('created_at').desc()),
+        )
+        .filter(rank__lte=TRIP_SUMMARY_TICKET_LIMIT)
+        .order_by('bus_id', '-created_at')
+        .values_list('bus_id', 'id', 'source_stop', 'destination_stop', 'fare_f', 'created_at')
+    )
 
-    return JsonResponse({'trip_active': True, 'tickets': tickets, 'total_amount': float(total_amount)})
+    summaries = {
+        bus.id: {'trip_active': True, 'tickets': [], 'total_amount': float(bus.active_trip.total_fare)}
+        for bus in buses
+    }
+    for bus_id, *ticket in rows.iterator(chunk_size=100):
+        summaries[bus_id]['tickets'].append(_ticket_row(*ticket))
 
+    return OrjsonResponse({'buses': {str(bus_id): summary for bus_id, summary in summaries.items()}})